@@ -19,10 +19,12 @@ import argparse
 import colorama
 import os
 import re
+import sys
 
 from src.code_generator import CodeGenerator
 from src.dir_hash_calculator import DirHashCalculator
 from src.config import Config
+from src.toolchain import Toolchain
 from src.util import Misc
 
 
@@ -48,6 +50,18 @@ def main():
             replaceable_options[k] = Misc.str_to_bool(environ_val)
 
     config.update(replaceable_options)
+
+    # resolve and check all binaries and limits before any digest has been saved or any generated code has been wiped
+    try:
+        toolchain = Toolchain(config)
+        code_generator = CodeGenerator(working_directory, config, toolchain)
+    except Exception as ex:
+        if config['porcelain']:
+            sys.stderr.write(f'{str(ex)}\n')
+            exit(1)
+        else:
+            raise
+
     config_changed = config.is_changed()
 
     # display config file
@@ -67,16 +81,22 @@ def main():
     if not os.path.isdir(abs_proto_folder):
         raise Exception(f"proto_root: \"{abs_proto_folder}\" is not a valid path")
 
-    dh = DirHashCalculator(config['force'] or config_changed)
+    toolchain_changed = toolchain.is_changed()
+
+    if toolchain_changed and config['verbose']:
+        print(colorama.Fore.MAGENTA + f'Toolchain in {toolchain.programs_root} has changed, regenerating all')
+
+    dh = DirHashCalculator(config['force'] or config_changed or toolchain_changed)
 
     changed, new_digest = dh.get_changed(abs_proto_folder, matcher)
     matching = dh.get_matching(abs_proto_folder, matcher)
 
     code_gen_args = (changed, matching, matcher)
-    CodeGenerator(working_directory, config).gen_all(*code_gen_args)
+    code_generator.gen_all(*code_gen_args)
 
     # The downside is that while there was any unsuccessfully built files, other ones will be re-compiled as well
     dh.save_digest(abs_proto_folder, new_digest)
+    toolchain.save()
 
     elapsed_time = round(time.time() - start_time, 3)
     print(colorama.Fore.WHITE + f"Build done in {elapsed_time} s")
@@ -20,15 +20,21 @@ import sys
 from colorama import Fore
 from src.util import TypeCoercer, Misc
 from src.proto_task import ProtoTask
+from src.job_scheduler import JobScheduler
 from src.config import Config
+from src.toolchain import Toolchain
 
 
 class CodeGenerator:
-    def __init__(self, root_dir: str, config: 'Config'):
+    def __init__(self, root_dir: str, config: 'Config', toolchain: 'Toolchain'):
         self.languages = config['languages']
         self.proto_root = os.path.join(root_dir, config['proto_root'])
         self.gen_root = os.path.join(root_dir, config['gen_root'])
         self.config = config
+        self.toolchain = toolchain
+
+        # created (and validated) beforehand, so bad limits are reported before any generated code has been wiped
+        self.scheduler = JobScheduler(config)
 
         if not os.path.isabs(self.gen_root):
             self.gen_root = os.path.join(root_dir, self.gen_root)
@@ -104,16 +110,15 @@ class CodeGenerator:
 
         progress = float(0)
         try:
-            for t in tasks:
-                t.run(self.config, self.proto_root)
-
-                # update progress
-                progress += (100.0 / float(len(tasks)))
-
-                # print progress
-                print(Fore.CYAN + f"[{str.rjust(str(int(round(progress))), 3, ' ')}%]",
-                      Fore.RESET + f"{t.proto_file} for",
-                      Fore.WHITE + Misc.pretty_language_name(t.lang))
+            if tasks:
+                for t in self.scheduler.run(tasks, all_files, self.toolchain, self.proto_root):
+                    # update progress
+                    progress += (100.0 / float(len(tasks)))
+
+                    # print progress
+                    print(Fore.CYAN + f"[{str.rjust(str(int(round(progress))), 3, ' ')}%]",
+                          Fore.RESET + f"{t.proto_file} for",
+                          Fore.WHITE + Misc.pretty_language_name(t.lang))
 
         except Exception as ex:
             if self.config['porcelain']:
@@ -23,14 +23,6 @@ class DirHashCalculator:
     def __init__(self, force: bool = False):
         self.force = force
 
-    @staticmethod
-    def load_digest(config_file: str):
-        if not os.path.exists(config_file):
-            return {}
-
-        with open(config_file) as cache:
-            return json.load(cache)
-
     @staticmethod
     def save_digest(base_dir: str, config: dict):
         config_file = os.path.join(base_dir, '.dir.digest')
@@ -55,7 +47,7 @@ class DirHashCalculator:
     def get_changed(self, base_dir, matcher):
         digest_path = os.path.join(base_dir, '.dir.digest')
 
-        old_digest = DirHashCalculator.load_digest(digest_path)
+        old_digest = Misc.load_json(digest_path)
         new_digest = {}
 
         changed = []
@@ -0,0 +1,413 @@
+#
+# Copyright 2018 Vizor Games LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+import json
+import os
+import platform
+import queue
+import re
+import signal
+import threading
+
+from collections import deque
+from colorama import Fore
+from subprocess import Popen, PIPE, DEVNULL
+from src.config import Config
+from src.proto_task import ProtoTask
+from src.toolchain import Toolchain
+from src.util import Misc
+
+
+class JobResult:
+    def __init__(self, task: ProtoTask, options: list, return_code: int, err, peak_rss: int):
+        """
+        Outcome of a single protoc invocation
+        :param task: task being executed
+        :param options: command line the task was executed with
+        :param return_code: exit code of protoc, negative if killed by a signal
+        :param err: protoc's stderr (bytes) or an exception raised when tried to run protoc
+        :param peak_rss: peak resident set size of protoc and its plugins in bytes, None if can't be measured
+        """
+        self.task = task
+        self.options = options
+        self.return_code = return_code
+        self.err = err
+        self.peak_rss = peak_rss
+
+
+class JobScheduler:
+    CostsFileName = '.protobuild.memory'
+
+    # used as an estimate of a file we've never seen before (in any language)
+    DefaultJobMemory = 256 * 1024 * 1024
+
+    # fraction of the available memory we're allowed to use if no explicit limit is given
+    AutoMemoryFraction = 0.8
+
+    # memory limits of the cgroup we're running in (v2 and v1), the host's memory is meaningless in a container
+    CgroupMemoryLimits = ['/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes']
+
+    MinBackoff = 0.05
+    MaxBackoff = 2.0
+
+    # ru_maxrss is reported in kilobytes everywhere, except Mac OS, where it's bytes
+    RssUnit = 1 if platform.system() == 'Darwin' else 1024
+
+    # how often memory of a running process tree is sampled, in seconds
+    SampleInterval = 0.1
+
+    # ru_maxrss is the peak of the heaviest process in the tree, not of the whole tree. When it's the only thing we
+    # can measure, a job using a plugin is accounted as two processes of that peak, since protoc stays resident
+    # while the plugin runs.
+    PluginMemoryFactor = 2
+
+    # there's no SIGKILL on Windows, so we never treat a task as killed there
+    KilledReturnCode = -signal.SIGKILL if hasattr(signal, 'SIGKILL') else None
+
+    # protoc survives when its plugin gets killed, just reporting it, e.g.
+    # '--grpc_out: protoc-gen-grpc: Plugin killed by signal 9.'
+    KilledPluginMatcher = re.compile(rb'Plugin killed by signal 9\b')
+
+    def __init__(self, config: Config):
+        """
+        Runs ProtoTasks concurrently, admitting a new job only while the projected memory
+        consumption and the system load stay under limits. Peak memory of every protoc run
+        is measured and remembered between runs, so the projection gets better over time.
+        :param config: loaded config, may define 'max_jobs', 'max_memory_mb' and 'max_load'
+        """
+        self.config = config
+        self.costs_path = os.path.join(config.working_directory, JobScheduler.CostsFileName)
+        self.costs = {}
+
+        cpu_count = os.cpu_count() or 1
+
+        self.max_jobs = JobScheduler.get_limit(config, 'max_jobs', int) or cpu_count
+        self.max_load = JobScheduler.get_limit(config, 'max_load', float) or float(cpu_count)
+
+        max_memory_mb = JobScheduler.get_limit(config, 'max_memory_mb', int)
+        if max_memory_mb:
+            self.max_memory = max_memory_mb * 1024 * 1024
+        else:
+            limits = [JobScheduler.get_available_memory(), JobScheduler.get_cgroup_memory_limit()]
+            available = min([m for m in limits if m], default=None)
+            self.max_memory = int(available * JobScheduler.AutoMemoryFraction) if available else None
+
+    @staticmethod
+    def get_limit(config: Config, key: str, t: type):
+        """
+        Reads an optional non-negative numeric limit from the config
+        :return: the limit converted to t, None if the limit isn't defined
+        """
+        value = config.options.get(key)
+        if value is None:
+            return None
+
+        try:
+            # booleans are numbers for python, but surely not for the config
+            if isinstance(value, bool):
+                raise ValueError()
+
+            limit = t(value)
+        except (TypeError, ValueError):
+            limit = None
+
+        if limit is None or limit < 0:
+            raise Exception(f"{key}: \"{value}\" is not a valid non-negative {t.__name__}")
+
+        return limit
+
+    def save_costs(self):
+        with open(self.costs_path, 'w') as cache:
+            cache.write(json.dumps(self.costs, indent=4, sort_keys=True))
+
+    @staticmethod
+    def get_available_memory():
+        """
+        :return: memory (in bytes) available for new processes, None if can't be determined
+        """
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None
+
+    @staticmethod
+    def get_cgroup_memory_limit():
+        """
+        :return: memory limit (in bytes) of the cgroup we're running in, None if there's no limit
+        """
+        for limit_path in JobScheduler.CgroupMemoryLimits:
+            try:
+                with open(limit_path) as limit_file:
+                    limit = limit_file.read().strip()
+            except OSError:
+                continue
+
+            # v2 reports 'max' for no limit, v1 reports a huge number, which is filtered out by min() anyway
+            if limit.isdigit():
+                return int(limit)
+
+        return None
+
+    @staticmethod
+    def get_load():
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+
+    @staticmethod
+    def cost_key(task: ProtoTask):
+        return f'{task.lang}:{task.proto_file}'
+
+    def estimate(self, task: ProtoTask):
+        known = self.costs.get(JobScheduler.cost_key(task))
+        if known:
+            return known
+
+        # assume an unknown file is as heavy as the heaviest one known for the same language
+        same_lang = [v for k, v in self.costs.items() if k.startswith(f'{task.lang}:')]
+        return max(same_lang) if same_lang else JobScheduler.DefaultJobMemory
+
+    def can_admit(self, task: ProtoTask, running: dict, exclusive: bool):
+        # a single job can always proceed, so we're backing off instead of failing
+        if not running:
+            return True
+
+        if exclusive or len(running) >= self.max_jobs:
+            return False
+
+        if self.max_memory and sum(running.values()) + self.estimate(task) > self.max_memory:
+            return False
+
+        load = JobScheduler.get_load()
+        if load is not None and load > self.max_load:
+            return False
+
+        return True
+
+    @staticmethod
+    def get_tree_rss(pid: int):
+        """
+        :return: total resident set size (in bytes) of the process and all its descendants,
+                    None if /proc is not available
+        """
+        if not os.path.isdir('/proc'):
+            return None
+
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    # process name may contain spaces and parentheses, ppid goes right after the last ')'
+                    ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+
+            children.setdefault(ppid, []).append(int(entry))
+
+        total_rss = 0
+        tree = [pid]
+        while tree:
+            current = tree.pop()
+            tree += children.get(current, [])
+
+            try:
+                with open(f'/proc/{current}/status') as status:
+                    for line in status:
+                        if line.startswith('VmRSS:'):
+                            total_rss += int(line.split()[1]) * 1024
+                            break
+            except (OSError, ValueError):
+                # the process has just exited
+                continue
+
+        return total_rss
+
+    @staticmethod
+    def sample(pid: int, done: threading.Event, peaks: list):
+        while not done.is_set():
+            tree_rss = JobScheduler.get_tree_rss(pid)
+            if tree_rss is None:
+                return
+
+            peaks.append(tree_rss)
+            done.wait(JobScheduler.SampleInterval)
+
+    @staticmethod
+    def wait(p: Popen):
+        """
+        Waits for the process, measuring its peak memory if possible
+        :return: tuple of the return code and peak RSS in bytes (None if not supported)
+        """
+        if not hasattr(os, 'wait4'):
+            return p.wait(), None
+
+        _, status, usage = os.wait4(p.pid, 0)
+
+        if os.WIFSIGNALED(status):
+            return_code = -os.WTERMSIG(status)
+        else:
+            return_code = os.WEXITSTATUS(status)
+
+        # the process has been reaped, so Popen mustn't try to wait for it again
+        p.returncode = return_code
+        return return_code, usage.ru_maxrss * JobScheduler.RssUnit
+
+    @staticmethod
+    def is_killed(result: JobResult):
+        if result.return_code == JobScheduler.KilledReturnCode:
+            return True
+
+        return bool(result.err) and JobScheduler.KilledPluginMatcher.search(result.err) is not None
+
+    @staticmethod
+    def execute(task: ProtoTask, options: list, results: queue.Queue):
+        try:
+            p = Popen(options, stdin=DEVNULL, stdout=DEVNULL, stderr=PIPE)
+
+            # protoc and its plugin are running simultaneously, so we need a peak of their sum
+            done = threading.Event()
+            tree_peaks = []
+            sampler = threading.Thread(target=JobScheduler.sample, args=(p.pid, done, tree_peaks), daemon=True)
+            sampler.start()
+
+            err = p.stderr.read()
+            p.stderr.close()
+
+            return_code, peak_rss = JobScheduler.wait(p)
+
+            done.set()
+            sampler.join()
+
+            if tree_peaks:
+                peak_rss = max(tree_peaks + [peak_rss or 0])
+            elif peak_rss and any(opt.startswith('--plugin=') for opt in options):
+                peak_rss *= JobScheduler.PluginMemoryFactor
+
+            results.put(JobResult(task, options, return_code, err, peak_rss))
+        except Exception as ex:
+            results.put(JobResult(task, options, None, ex, None))
+
+    def forget_costs(self, all_files: list):
+        """
+        Drops costs of files (or languages) we don't generate anymore,
+        otherwise a deleted heavy file would inflate estimates of all new files forever
+        :param all_files: RELATIVE paths of all matching *.proto files
+        """
+        known_keys = {f'{lang}:{f}' for lang in self.config['languages'] for f in all_files}
+        self.costs = {k: v for k, v in self.costs.items() if k in known_keys}
+
+    def run(self, tasks: list, all_files: list, toolchain: Toolchain, proto_root: str):
+        """
+        Executes all tasks, yielding each one as soon as it's done.
+        Stops admitting new jobs on the first error, waits for running ones and re-raises it.
+        :param tasks: list of ProtoTask
+        :param all_files: RELATIVE paths of all matching *.proto files
+        :param toolchain: toolchain, resolved once per run
+        :param proto_root: an ABSOLUTE path to the folder being searched for *.proto files
+        """
+        if self.config['verbose']:
+            memory_str = f'{self.max_memory // (1024 * 1024)} MB' if self.max_memory else 'unlimited'
+            print(Fore.MAGENTA + f'Max jobs: {self.max_jobs}, max memory: {memory_str}, max load: {self.max_load}')
+
+        self.costs = Misc.load_json(self.costs_path)
+        self.forget_costs(all_files + [t.proto_file for t in tasks])
+
+        pending = deque(tasks)
+        running = {}
+        results = queue.Queue()
+
+        # tasks killed (most likely by the OOM killer) are given another chance, being run alone
+        retried = set()
+        exclusive = False
+
+        first_error = None
+        backoff = JobScheduler.MinBackoff
+
+        try:
+            while pending or running:
+                if first_error is not None:
+                    pending.clear()
+
+                if pending:
+                    task = pending[0]
+                    task_exclusive = task in retried
+
+                    if self.can_admit(task, running, exclusive or task_exclusive):
+                        pending.popleft()
+
+                        try:
+                            options = task.get_invocation(self.config, toolchain, proto_root)
+                        except Exception as ex:
+                            first_error = ex
+                            continue
+
+                        running[task] = self.estimate(task)
+                        exclusive = task_exclusive
+
+                        threading.Thread(target=JobScheduler.execute, args=(task, options, results), daemon=True).start()
+                        backoff = JobScheduler.MinBackoff
+                        continue
+
+                try:
+                    # wake up periodically while there's pending work, since the load may drop
+                    result = results.get(timeout=backoff if pending else None)
+                except queue.Empty:
+                    backoff = min(backoff * 2, JobScheduler.MaxBackoff)
+                    continue
+
+                task = result.task
+                del running[task]
+                exclusive = False
+
+                if result.peak_rss:
+                    self.costs[JobScheduler.cost_key(task)] = result.peak_rss
+
+                if first_error is not None:
+                    continue
+
+                if isinstance(result.err, Exception):
+                    first_error = result.err
+                    continue
+
+                if JobScheduler.is_killed(result) and task not in retried:
+                    print(Fore.YELLOW + f'{task.proto_file} has been killed, retrying it alone')
+                    retried.add(task)
+                    pending.appendleft(task)
+                    continue
+
+                try:
+                    task.check_result(self.config, result.options, result.return_code, result.err)
+                except Exception as ex:
+                    first_error = ex
+                    continue
+
+                yield task
+        finally:
+            self.save_costs()
+
+        if first_error is not None:
+            raise first_error
@@ -16,15 +16,16 @@
 import os
 
 from colorama import Fore
-from subprocess import Popen, PIPE
 from src.util import Misc, PathConverter
 from src.config import Config
+from src.toolchain import Toolchain
 
 
 class ProtoTask:
     def __init__(self, lang: str, out_dir: str, proto_file: str):
         """
-        Runs protoc to generate wrapper for proto_file
+        Builds a protoc invocation generating wrapper for proto_file and checks its result,
+        the invocation itself is executed by JobScheduler
         :param lang: language from list of available languages
         :param out_dir: an ABSOLUTE path to the directory where generated code will reside
         :param proto_file: a RELATIVE (to self.grpc_root) path to .proto file
@@ -33,38 +34,29 @@ class ProtoTask:
         self.out_dir = out_dir
         self.proto_file = proto_file
 
-    def run(self, config: Config, proto_root: str):
+    def get_invocation(self, config: Config, toolchain: Toolchain, proto_root: str):
+        """
+        Builds a protoc command line for the task
+        :param config: loaded config
+        :param toolchain: toolchain, resolved once per run
+        :param proto_root: an ABSOLUTE path to the folder being searched for *.proto files
+        :return: list of arguments, suitable for Popen
+        """
         abs_proto_file = PathConverter.to_absolute(proto_root, self.proto_file)
 
         if not os.path.exists(abs_proto_file):
             raise SystemError(f"{self.proto_file} does not exist in {proto_root}")
 
-        programs_root = os.path.abspath(os.path.join(config['programs_root'], Misc.get_binary_release_os()))
-
-        if not programs_root:
-            raise Exception("programs_root config variable should be defined")
-
-        if not os.path.isdir(programs_root):
-            raise Exception(f"programs_root: {programs_root} is not a directory")
-
         include_dir = proto_root + PathConverter.include_suffix(self.proto_file)
-        path_to_proto_compiler = f"{os.path.join(programs_root, Misc.add_exec_suffix('protoc'))}"
 
         gen_transport = config['transport']
-        options = [path_to_proto_compiler, f'-I={include_dir}']
+        options = [toolchain.protoc, f'-I={include_dir}']
 
-        path_to_plugin = os.path.join(programs_root, Misc.add_exec_suffix(Misc.plugin_for_lang(self.lang)))
+        options += self.getOptions(toolchain.protoc_options)
 
-        if 'protoc_options' in config.options.keys():
-            for opt in self.getOptions(config["protoc_options"]):
-                options.append(opt)
-            
         if self.lang == 'go':
-            if 'protoc_options_go' in config.options.keys():
-                for opt in self.getOptions(config["protoc_options_go"]):
-                    options.append(opt)
-
-            options.append(f'--plugin={path_to_plugin}')
+            options += self.getOptions(toolchain.protoc_options_go)
+            options.append(f'--plugin={toolchain.plugin_path(self.lang)}')
 
             if gen_transport:
                 options.append(f'--{self.lang}_out=plugins=grpc:{self.out_dir}')
@@ -76,7 +68,7 @@ class ProtoTask:
         # if we're generating transport code, we must declare a plugin and --grpc_out
         if gen_transport and (self.lang != 'go'):
             options += [
-                f'--plugin=protoc-gen-grpc={path_to_plugin}',
+                f'--plugin=protoc-gen-grpc={toolchain.plugin_path(self.lang)}',
                 f'--grpc_out={self.out_dir}'
             ]
 
@@ -86,10 +78,10 @@ class ProtoTask:
         if config['verbose']:
             print(Fore.MAGENTA + f">> {' '.join(options)}")
 
-        p = Popen(options, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-        output, err = p.communicate()
+        return options
 
-        if p.returncode != 0:
+    def check_result(self, config: Config, options: list, return_code: int, err: bytes):
+        if return_code != 0:
             if config['porcelain']:
                 raise SyntaxError('Unable to convert {} to {}. Error: {}'.format(
                     self.proto_file,
@@ -101,19 +93,10 @@ class ProtoTask:
                     self.proto_file,
                     Misc.pretty_language_name(self.lang),
                     ' '.join(options),
-                    p.returncode,
+                    return_code,
                     err.decode('utf-8')
                 ))
 
-    def getOptions(self, options: dict): 
-        result = []
-        for opt in options:
-            if type(opt) != str:
-                continue
-
-            if '@out_dir' in opt:
-                opt = opt.replace("@out_dir", f"{self.out_dir}")
-            result.append(os.path.expandvars(opt))
-
-        return result
-        
+    def getOptions(self, options: list):
+        # options are already filtered and expanded by the toolchain
+        return [opt.replace("@out_dir", f"{self.out_dir}") for opt in options]
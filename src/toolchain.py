@@ -0,0 +1,128 @@
+#
+# Copyright 2018 Vizor Games LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+import hashlib
+import json
+import os
+
+from src.util import Misc
+from src.config import Config
+
+
+class Toolchain:
+    CacheFileName = '.protobuild.toolchain'
+
+    def __init__(self, config: Config):
+        """
+        Resolves protoc and language plugins once per run and checks they're all in place,
+        so we fail before any generated code has been wiped.
+        :param config: loaded config
+        """
+        if not config['programs_root']:
+            raise Exception("programs_root config variable should be defined")
+
+        self.programs_root = os.path.abspath(os.path.join(config['programs_root'], Misc.get_binary_release_os()))
+
+        if not os.path.isdir(self.programs_root):
+            raise Exception(f"programs_root: {self.programs_root} is not a directory")
+
+        self.protoc = os.path.join(self.programs_root, Misc.add_exec_suffix('protoc'))
+
+        # plugins are only resolved for supported languages, the others are reported (and skipped) by CodeGenerator
+        self.plugins = {}
+        for lang in config['languages']:
+            plugin = Misc.plugin_for_lang(lang)
+            if plugin and Toolchain.needs_plugin(lang, config['transport']):
+                self.plugins[lang] = os.path.join(self.programs_root, Misc.add_exec_suffix(plugin))
+
+        missing = [p for p in [self.protoc, *self.plugins.values()] if not Toolchain.is_executable(p)]
+        if missing:
+            raise Exception('Missing or not executable toolchain binaries in {}:\n{}'.format(
+                self.programs_root,
+                '\n'.join(f' > {p}' for p in missing)
+            ))
+
+        # these options are the same for any task, so only '@out_dir' is left to be substituted
+        self.protoc_options = Toolchain.expand_options(config.options.get('protoc_options', []))
+        self.protoc_options_go = Toolchain.expand_options(config.options.get('protoc_options_go', []))
+
+        self.cache_path = os.path.join(config.working_directory, Toolchain.CacheFileName)
+        self.__fingerprint = None
+        self.__old_fingerprint = None
+        self.__binaries = {}
+
+    @staticmethod
+    def needs_plugin(lang: str, transport: bool):
+        # go always generates via its plugin, the others need a plugin only for transport code
+        return lang == 'go' or transport
+
+    @staticmethod
+    def is_executable(path: str):
+        return os.path.isfile(path) and os.access(path, os.X_OK)
+
+    @staticmethod
+    def expand_options(options: list):
+        return [os.path.expandvars(opt) for opt in (options or []) if type(opt) == str]
+
+    def plugin_path(self, lang: str):
+        return self.plugins[lang]
+
+    def binaries(self):
+        return [self.protoc, *sorted(self.plugins.values())]
+
+    def fingerprint(self):
+        """
+        Calculates a hash of all binaries in the toolchain. Binaries are only re-hashed when
+        their size or modification time has changed since the previous run.
+        :return: hex digest of the toolchain
+        """
+        if self.__fingerprint:
+            return self.__fingerprint
+
+        cache = Misc.load_json(self.cache_path)
+        cached_hashes = cache.get('binaries', {})
+        new_hashes = {}
+
+        toolchain_hash = hashlib.sha256()
+        for binary in self.binaries():
+            stat = os.stat(binary)
+            stat_key = f'{stat.st_size}:{stat.st_mtime_ns}'
+
+            cached = cached_hashes.get(binary, {})
+            if cached.get('stat') == stat_key:
+                binary_hash = cached['hash']
+            else:
+                binary_hash = Misc.hash_of_file(binary)
+
+            new_hashes[binary] = {'stat': stat_key, 'hash': binary_hash}
+            toolchain_hash.update(f'{os.path.basename(binary)}:{binary_hash}'.encode('utf-8'))
+
+        self.__fingerprint = toolchain_hash.hexdigest()
+        self.__old_fingerprint = cache.get('fingerprint', '')
+        self.__binaries = new_hashes
+
+        return self.__fingerprint
+
+    def is_changed(self):
+        # changed if fingerprints differs
+        return self.fingerprint() != self.__old_fingerprint
+
+    def save(self):
+        """
+        Remembers the fingerprint, must be called only when all code has been successfully generated,
+        otherwise wrappers wiped by a failed run would be considered up-to-date
+        """
+        with open(self.cache_path, 'w') as cache:
+            cache.write(json.dumps({'fingerprint': self.fingerprint(), 'binaries': self.__binaries}, indent=4))
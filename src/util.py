@@ -13,6 +13,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 #
+import json
 import os
 import platform
 import hashlib
@@ -132,6 +133,23 @@ class Misc:
 
         return hash_object.hexdigest()
 
+    @staticmethod
+    def load_json(file_name: str):
+        """
+        Loads a JSON cache file
+        :param file_name: path to the file
+        :return: loaded object, an empty dict if the file doesn't exist or is broken
+        """
+        if not os.path.exists(file_name):
+            return {}
+
+        try:
+            with open(file_name) as cache:
+                return json.load(cache)
+        except ValueError:
+            # a broken cache is not a reason to fail, it will be rebuilt
+            return {}
+
     @staticmethod
     def change_ext_recursive(root_path: str, ext: str, new_ext: str):
         for root, sub, files in os.walk(root_path):